@@ -1,103 +1,174 @@
-from dataclasses import dataclass, field
-from dataclasses_json import dataclass_json
-from io import TextIOBase
-from typing import AnyStr, List, Iterator, Optional, Tuple
+from typing import BinaryIO, Iterable, List, Iterator, Optional
 
 import argparse
-import json
+import mmap
+import msgspec
+import os
 import random
-import re
 import sys
 
+try:
+    # re2 matches with a DFA in guaranteed linear time, so pathological
+    # inputs (e.g. a stray unclosed $) cannot blow up the gap scan.
+    import re2 as re
+except ImportError:
+    import re
 
-CASE_PREFIX = "Case: "
-QUESTION_PREFIX = "Question: "
-ANSWER_PREFIX = "- "
-ITEM_TERMINAL_LINE = "###"
 
-gapfind_re = re.compile("([$].*?[$])")
+# The parse loop works on raw bytes; lines are only decoded once a field
+# value is actually stored on an Item.
+CASE_PREFIX = b"Case: "
+QUESTION_PREFIX = b"Question: "
+ANSWER_PREFIX = b"- "
+ITEM_TERMINAL_LINE = b"###"
 
+CASE_PREFIX_LEN = len(CASE_PREFIX)
+QUESTION_PREFIX_LEN = len(QUESTION_PREFIX)
+ANSWER_PREFIX_LEN = len(ANSWER_PREFIX)
 
-@dataclass_json
-@dataclass
-class GapFillQuestion:
-    gap_span: Tuple[int, int]
-    answer: int
-    distractors: List[AnyStr]
+# Dispatch on the first byte so each line pays one dict lookup plus at
+# most one startswith, rather than three chained prefix comparisons.
+PREFIX_DISPATCH = {
+    CASE_PREFIX[:1]: (CASE_PREFIX, CASE_PREFIX_LEN, "case"),
+    QUESTION_PREFIX[:1]: (QUESTION_PREFIX, QUESTION_PREFIX_LEN, "question"),
+    ANSWER_PREFIX[:1]: (ANSWER_PREFIX, ANSWER_PREFIX_LEN, "answers"),
+}
 
+gapfind_re = re.compile(r"\$.*?\$")
 
-@dataclass_json
-@dataclass
-class Item:
 
-    case: AnyStr = None
-    question: AnyStr = None
-    answers: List[AnyStr] = field(default_factory=list)
-    gap_fill_questions: List[GapFillQuestion] = field(default_factory=list)
+class GapFillQuestion(msgspec.Struct):
+    gap_start: int
+    gap_end: int
+    answer: str
+    distractors: List[str]
+
+
+class Item(msgspec.Struct):
+
+    case: Optional[str] = None
+    question: Optional[str] = None
+    answers: List[str] = msgspec.field(default_factory=list)
+    gap_fill_questions: List[GapFillQuestion] = msgspec.field(default_factory=list)
 
     def generate_questions(self):
         questions = []
-        gap_matches = [_ for _ in gapfind_re.finditer(self.case)]
-        for i, gap in enumerate(gap_matches):
-            gap_span = gap.span()
-            answer = gap.group()
-            distractor_indices = []
-
-            while len(distractor_indices) < min(len(gap_matches), 4):
-                idx = random.randint(0, len(gap_matches)-1)
-                if idx != i and idx not in distractor_indices:
-                    distractor_indices.append(idx)
-
-            distractors = [gap_matches[i].group() for i in distractor_indices]
-            questions.append(GapFillQuestion(gap_span, answer, distractors))
+        # Materialize (span, text) pairs up front; the distractor loop would
+        # otherwise call .group() on the match objects for every draw.
+        gap_info = [(m.span(), m.group()) for m in gapfind_re.finditer(self.case)]
+        n_gaps = len(gap_info)
+        n_distractors = min(n_gaps - 1, 4)
+        sample = random.sample
+        compact_range = range(n_gaps - 1)
+        for i, ((gap_start, gap_end), answer) in enumerate(gap_info):
+            # Sampling from n_gaps - 1 slots and shifting indices past i
+            # excludes the current gap without building a candidate list
+            # per gap.
+            picks = sample(compact_range, n_distractors)
+            distractors = [gap_info[j + 1 if j >= i else j][1] for j in picks]
+            questions.append(
+                GapFillQuestion(gap_start, gap_end, answer, distractors))
         return questions
 
-    @property
-    def is_empty(self) -> bool:
-        return not (self.case or self.question or self.answers)
-
     @classmethod
-    def next_item(cls, fp: TextIOBase) -> Optional["Item"]:
-        """
-        Given an TextIO stream, read in the next Item
+    def iter_items(cls, fin: Iterable[bytes]) -> Iterator["Item"]:
         """
+        Given a byte-line stream, iterate through the Items it contains.
 
-        # create empty item
+        The per-item parse is inlined here so the whole stream is consumed
+        in one loop frame, with no per-item function call or generator
+        restart.  As before, a terminator with no preceding fields ends the
+        iteration.
+        """
         item = Item()
+        answers_append = item.answers.append
+        populated = False
 
         # For simplicity we read until we find an Item terminator.
         # Any properties get overwritten or appended
-        for line in fp:
-            # NOTE: Using rstrip() to eliminate carriage return, but this will
-            # also take out other trailing whitespace.
-            line = line.rstrip()
+        for line in fin:
+            # Lines arrive already split on \n; only a CRLF carriage return
+            # remains to trim.  Other trailing whitespace is left intact.
+            if line.endswith(b"\r"):
+                line = line[:-1]
             if line == ITEM_TERMINAL_LINE:
-                break
-            elif line.startswith(CASE_PREFIX):
-                item.case = line[len(CASE_PREFIX):]
-            elif line.startswith(QUESTION_PREFIX):
-                item.question = line[len(QUESTION_PREFIX):]
-            elif line.startswith(ANSWER_PREFIX):
-                item.answers.append(line[len(ANSWER_PREFIX):])
-
-        if item.is_empty:
-            # if no properties set on the item, return None
-            return None
-        else:
-            item.gap_fill_questions = item.generate_questions()
-            return item
-
-    @classmethod
-    def iter_items(cls, fin: TextIOBase) -> Iterator["Item"]:
-        """
-        Given a text stream, iterate through
-        """
-        while True:
-            item = cls.next_item(fin)
-            if item:
+                if not populated:
+                    # no properties set on the item, so stop
+                    return
+                item.gap_fill_questions = item.generate_questions()
                 yield item
-            else:
-                return
+                item = Item()
+                answers_append = item.answers.append
+                populated = False
+                continue
+            entry = PREFIX_DISPATCH.get(line[:1])
+            if entry is not None:
+                prefix, prefix_len, attr = entry
+                if line.startswith(prefix):
+                    if attr == "answers":
+                        answers_append(line[prefix_len:].decode("utf-8"))
+                    else:
+                        setattr(item, attr, line[prefix_len:].decode("utf-8"))
+                    populated = True
+
+        if populated:
+            item.gap_fill_questions = item.generate_questions()
+            yield item
+
+
+def iter_lines(fp: BinaryIO, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """
+    Yield byte lines (without their \\n terminator) by reading chunk_size
+    blocks and splitting each in one C-level pass, instead of re-entering
+    the interpreter with a readline call per line.
+    """
+    remainder = b""
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def iter_lines_mmap(path: str) -> Iterator[bytes]:
+    """
+    Yield raw byte lines from a memory-mapped file.  The chunked split runs
+    against the page cache with no read() syscalls, buffered-IO refills, or
+    text decoding in the loop.
+    """
+    with open(path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # mmap refuses zero-length files
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            yield from iter_lines(mm)
+
+
+def dump_items(items: Iterable[Item], fout: BinaryIO, jsonl: bool = False):
+    """
+    Stream items to fout, one item encoded at a time so peak memory stays
+    constant regardless of corpus size.  Output is a JSON array by default,
+    or newline-delimited JSON (one item per line) when jsonl is set.
+    """
+    if jsonl:
+        for item in items:
+            fout.write(msgspec.json.encode(item))
+            fout.write(b"\n")
+        return
+
+    fout.write(b"[")
+    first = True
+    for item in items:
+        if first:
+            first = False
+        else:
+            fout.write(b",")
+        fout.write(msgspec.json.encode(item))
+    fout.write(b"]")
 
 
 def main():
@@ -111,19 +182,21 @@ def main():
         "--file_out",
         help="path to output text file.  If unspecified will write to STDOUT",
         default=None)
+    parser.add_argument(
+        "--jsonl",
+        help="write newline-delimited JSON (one Item per line) instead of a JSON array",
+        action="store_true")
     args = parser.parse_args()
 
-    if args.file_in:
-        with open(args.file_in, 'r') as fin:
-            items = [_.to_dict() for _ in Item.iter_items(fin)]
-    else:
-        items = [_.to_dict() for _ in Item.iter_items(sys.stdin)]
-
-    if args.file_out:
-        with open(args.file_out, 'w') as fout:
-            json.dump(items, fout)
-    else:
-        json.dump(items, sys.stdout)
+    fin = (iter_lines_mmap(args.file_in)
+           if args.file_in else iter_lines(sys.stdin.buffer))
+    fout = (open(args.file_out, 'wb', buffering=1024 * 1024)
+            if args.file_out else sys.stdout.buffer)
+    try:
+        dump_items(Item.iter_items(fin), fout, jsonl=args.jsonl)
+    finally:
+        if args.file_out:
+            fout.close()
 
 
 if __name__ == "__main__":
@@ -1,41 +1,44 @@
-from dataclasses import dataclass
-from io import TextIOBase
-from typing import AnyStr, List, Iterator, Optional
+from typing import BinaryIO, Iterable, List, Iterator, Optional
 
 import argparse
-import json
+import msgspec
 import sys
 
 
-CASE_PREFIX = "Case: "
-QUESTION_PREFIX = "Question: "
-ANSWER_PREFIX = "- "
-CASE_TERMINAL_LINE = "###"
+# The parse loop works on raw bytes; lines are only decoded once a field
+# value is actually stored on an Item.
+CASE_PREFIX = b"Case: "
+QUESTION_PREFIX = b"Question: "
+ANSWER_PREFIX = b"- "
+CASE_TERMINAL_LINE = b"###"
+
+CASE_PREFIX_LEN = len(CASE_PREFIX)
+QUESTION_PREFIX_LEN = len(QUESTION_PREFIX)
+ANSWER_PREFIX_LEN = len(ANSWER_PREFIX)
 
 
 class ItemParseError(Exception):
     pass
 
 
-@dataclass
-class Item:
-    case: AnyStr
-    question: AnyStr
-    answers: List[AnyStr]
+class Item(msgspec.Struct):
+    case: str
+    question: str
+    answers: List[str]
 
     @classmethod
-    def next_item(cls, fp: TextIOBase) -> Optional["Item"]:
+    def next_item(cls, fp: Iterator[bytes]) -> Optional["Item"]:
         # NOTE: This version assumes a well-formed Item with strict ordering
         # starting with Case, followed by one Question and then multiple answers
         # If anything violates this, an exception is thrown
 
-        # NOTE: Using rstrip() to eliminate carriage return, but this will also
-        # take out other trailing whitespace.
+        # NOTE: Lines arrive already split on \n; only a CRLF carriage
+        # return remains to trim, so other trailing whitespace is preserved.
 
         # Find first non-whitespace line
         case_line = None
         for line in fp:
-            if line.strip() != "":
+            if line.strip() != b"":
                 case_line = line
                 break
         if not case_line:
@@ -43,38 +46,45 @@ class Item:
             return None
 
         # Check for Case Line
+        if case_line.endswith(b"\r"):
+            case_line = case_line[:-1]
         if not case_line.startswith(CASE_PREFIX):
-            raise ItemParseError(f"'{CASE_PREFIX}' does not start Item")
-        case = case_line[len(CASE_PREFIX):]
+            raise ItemParseError(
+                f"'{CASE_PREFIX.decode()}' does not start Item")
+        case = case_line[CASE_PREFIX_LEN:].decode("utf-8")
 
         # Check for Question line
-        question_line = fp.readline().rstrip()
+        question_line = next(fp, b"")
+        if question_line.endswith(b"\r"):
+            question_line = question_line[:-1]
         if not question_line.startswith(QUESTION_PREFIX):
             raise ItemParseError(
-                f"Unexpected input.  Was expecting '{QUESTION_PREFIX}' line.\n"
-                f"Received: {question_line}"
+                f"Unexpected input.  Was expecting '{QUESTION_PREFIX.decode()}' line.\n"
+                f"Received: {question_line.decode('utf-8', 'replace')}"
             )
-        question = question_line[len(QUESTION_PREFIX):]
+        question = question_line[QUESTION_PREFIX_LEN:].decode("utf-8")
 
         # Look for answers
         answers = []
+        answers_append = answers.append
         for line in fp:
-            line = line.rstrip()
-            if line.rstrip() == CASE_TERMINAL_LINE:
+            if line.endswith(b"\r"):
+                line = line[:-1]
+            if line == CASE_TERMINAL_LINE:
                 break
-            elif line.startswith("- "):
-                answers.append(line[len(ANSWER_PREFIX):])
+            elif line.startswith(ANSWER_PREFIX):
+                answers_append(line[ANSWER_PREFIX_LEN:].decode("utf-8"))
             else:
                 raise ItemParseError(
-                    f"Unexpected input.  Was expecting '{CASE_TERMINAL_LINE}'.\n"
-                    f"Received: {line}"
+                    f"Unexpected input.  Was expecting '{CASE_TERMINAL_LINE.decode()}'.\n"
+                    f"Received: {line.decode('utf-8', 'replace')}"
                 )
         return Item(case=case, question=question, answers=answers)
 
     @classmethod
-    def iter_items(cls, fin: TextIOBase) -> Iterator["Item"]:
+    def iter_items(cls, fin: Iterator[bytes]) -> Iterator["Item"]:
         """
-        Given a text file, iterate through
+        Given a byte-line stream, iterate through
         """
         while True:
             item = cls.next_item(fin)
@@ -83,8 +93,46 @@ class Item:
             else:
                 return
 
-    def to_dict(self):
-        return self.__dict__
+
+def iter_lines(fp: BinaryIO, chunk_size: int = 1 << 20) -> Iterator[bytes]:
+    """
+    Yield byte lines (without their \\n terminator) by reading chunk_size
+    blocks and splitting each in one C-level pass, instead of re-entering
+    the interpreter with a readline call per line.
+    """
+    remainder = b""
+    while True:
+        chunk = fp.read(chunk_size)
+        if not chunk:
+            break
+        lines = (remainder + chunk).split(b"\n")
+        remainder = lines.pop()
+        yield from lines
+    if remainder:
+        yield remainder
+
+
+def dump_items(items: Iterable[Item], fout: BinaryIO, jsonl: bool = False):
+    """
+    Stream items to fout, one item encoded at a time so peak memory stays
+    constant regardless of corpus size.  Output is a JSON array by default,
+    or newline-delimited JSON (one item per line) when jsonl is set.
+    """
+    if jsonl:
+        for item in items:
+            fout.write(msgspec.json.encode(item))
+            fout.write(b"\n")
+        return
+
+    fout.write(b"[")
+    first = True
+    for item in items:
+        if first:
+            first = False
+        else:
+            fout.write(b",")
+        fout.write(msgspec.json.encode(item))
+    fout.write(b"]")
 
 
 def main():
@@ -98,19 +146,23 @@ def main():
         "--file_out",
         help="path to output text file.  If unspecified will write to STDOUT",
         default=None)
+    parser.add_argument(
+        "--jsonl",
+        help="write newline-delimited JSON (one Item per line) instead of a JSON array",
+        action="store_true")
     args = parser.parse_args()
 
-    if args.file_in:
-        with open(args.file_in, 'r') as fin:
-            items = [_.to_dict() for _ in Item.iter_items(fin)]
-    else:
-        items = [_.to_dict() for _ in Item.iter_items(sys.stdin)]
-
-    if args.file_out:
-        with open(args.file_out, 'w') as fout:
-            json.dump(items, fout)
-    else:
-        json.dump(items, sys.stdout)
+    fin = (open(args.file_in, 'rb', buffering=1024 * 1024)
+           if args.file_in else sys.stdin.buffer)
+    fout = (open(args.file_out, 'wb', buffering=1024 * 1024)
+            if args.file_out else sys.stdout.buffer)
+    try:
+        dump_items(Item.iter_items(iter_lines(fin)), fout, jsonl=args.jsonl)
+    finally:
+        if args.file_in:
+            fin.close()
+        if args.file_out:
+            fout.close()
 
 
 if __name__ == "__main__":